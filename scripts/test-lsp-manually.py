@@ -4,35 +4,111 @@ Manual LSP test script to verify hover/completion/diagnostics functionality.
 Uses real test fixture files from the project's test directory.
 """
 
+import functools
+import hashlib
 import json
+import logging
 import subprocess
 import sys
 import time
 import os
-import select
+import re
+import selectors
 import fcntl
-from typing import Any, Dict, Optional, List
-
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-FIXTURE_DIR = os.path.join(PROJECT_ROOT, "tests", "fixtures", "kotlin")
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, List, Set, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when orjson is missing
+    orjson = None
+
+# Per-message tracing; enable with LSPTEST_LOG=debug.
+log = logging.getLogger("lsptest")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+FIXTURE_DIR = PROJECT_ROOT / "tests" / "fixtures" / "kotlin"
+TEST_FILE = FIXTURE_DIR / "correct" / "ClassHierarchy.kt"
+ERROR_FILE = FIXTURE_DIR / "errors" / "TypeMismatch.kt"
+SERVER_DIR = PROJECT_ROOT / "server"
+SERVER_BIN = SERVER_DIR / "target" / "debug" / "kotlin-analyzer"
+# Lives under target/ so `cargo clean` discards it along with the binary.
+BUILD_STAMP = SERVER_DIR / "target" / ".lsp-test-build.stamp"
+
+# The fixture directory doubles as the LSP workspace root.
+ROOT_URI = FIXTURE_DIR.as_uri()
+TEST_URI = TEST_FILE.as_uri()
+ERROR_URI = ERROR_FILE.as_uri()
+
+# Server log lines that mean the sidecar finished starting up.
+READY_RE = re.compile(r"sidecar ready|sidecar started successfully")
+SIDECAR_STARTUP_TIMEOUT = 20
+DIAGNOSTICS_TIMEOUT = 10
+
+# Linux-only fcntl to grow a pipe's kernel buffer (Python < 3.10 lacks the name).
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031) if sys.platform.startswith("linux") else None
+PIPE_SIZE = 1 << 20
+
+# Summary icon per result status; anything else gets ⚠️.
+ICON = {"PASS": "✅", "FAIL": "❌"}.get
 
 class LSPClient:
-    def __init__(self, server_path: str):
+    # Fallback serializer when orjson is unavailable, configured once.
+    _ENCODE = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, check_circular=False).encode
+
+    def __init__(self, server_path: Path):
         self.process = subprocess.Popen(
             [server_path, "--log-level", "debug"],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=False
+            text=False,
+            bufsize=0
         )
         self.request_id = 0
 
-        # Make stderr non-blocking for reading logs
-        fd = self.process.stderr.fileno()
-        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
-        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # Larger pipes let the server write bursts of diagnostics and logs
+        # without blocking on us. Unprivileged users may be capped below
+        # PIPE_SIZE by /proc/sys/fs/pipe-max-size; keep the default then.
+        if F_SETPIPE_SZ is not None:
+            for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+                try:
+                    fcntl.fcntl(pipe.fileno(), F_SETPIPE_SZ, PIPE_SIZE)
+                except OSError:
+                    pass
+
+        # Bytes read from stdout but not yet parsed; unconsumed bytes carry
+        # over so one read can serve several messages.
+        self._rx_buf = bytearray()
+        self._stdout_eof = False
+
+        # Server notifications by method, in arrival order, recorded while we
+        # wait on responses, pump() or wait_notification().
+        self.notifications: Dict[str, List[Dict[str, Any]]] = {}
+        # Responses read off the wire but not yet claimed, by request id
+        self._pending: Dict[int, Dict[str, Any]] = {}
+
+        # Make stdout and stderr non-blocking; both are multiplexed through
+        # one selector and drained until EAGAIN whenever they are ready.
+        for pipe in (self.process.stdout, self.process.stderr):
+            fd = pipe.fileno()
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # stderr bytes drained so far but not yet returned by read_stderr()
+        self._stderr_buf = bytearray()
+        self._stderr_eof = False
+
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.process.stdout, selectors.EVENT_READ, "stdout")
+        self.sel.register(self.process.stderr, selectors.EVENT_READ, "stderr")
 
     def send_request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        request_id = self.send_request_async(method, params)
+        self._drain_until(request_id)
+        return self._pending.pop(request_id, {})
+
+    def send_request_async(self, method: str, params: Dict[str, Any]) -> int:
+        """Send a request without waiting for its response; returns the request id."""
         self.request_id += 1
         request_id = self.request_id
         request = {
@@ -42,47 +118,168 @@ class LSPClient:
             "params": params
         }
 
-        message = json.dumps(request)
-        content_length = len(message.encode('utf-8'))
-        header = f"Content-Length: {content_length}\r\n\r\n"
+        log.debug("→ %s id=%d", method, request_id)
+        self._write_message(request)
+        return request_id
 
-        full_message = header + message
-        print(f"\n→ Sending {method} (id={request_id})")
+    def wait_for(self, ids: Set[int]) -> Dict[int, Dict[str, Any]]:
+        """Read messages until responses for all `ids` have arrived, in any order.
 
-        self.process.stdin.write(full_message.encode('utf-8'))
-        self.process.stdin.flush()
+        Returns whatever was collected if the server closes stdout first.
+        """
+        for request_id in ids:
+            if not self._drain_until(request_id):
+                break
+        return {i: self._pending.pop(i) for i in ids if i in self._pending}
 
-        # Read responses until we get our response (skip notifications)
-        while True:
+    def _drain_until(self, request_id: int) -> bool:
+        """Dispatch incoming messages until the response to `request_id` is pending.
+
+        Returns False if the server closes stdout first.
+        """
+        while request_id not in self._pending:
             msg = self._read_message()
             if msg is None:
-                return {}
-            # Notifications don't have an id
-            if "id" in msg and msg["id"] == request_id:
-                return msg
-            else:
-                # It's a notification or response to another request
-                method_name = msg.get("method", "unknown")
-                if "method" in msg:
-                    print(f"  [notification: {method_name}]")
-
-    def _read_message(self) -> Optional[Dict]:
-        """Read a single JSON-RPC message from stdout."""
-        headers = {}
+                return False
+            self._dispatch(msg)
+        return True
+
+    def _dispatch(self, msg: Dict[str, Any]):
+        """File a message as a response by id, or as a notification by method."""
+        # Server-to-client requests carry both an id and a method; their ids
+        # are the server's own, so file them with notifications.
+        if "method" in msg:
+            self._record_notification(msg)
+        elif "id" in msg:
+            self._pending[msg["id"]] = msg
+
+    def pump(self, seconds: float):
+        """Consume server output for `seconds`, recording notifications as they arrive."""
+        deadline = time.monotonic() + seconds
         while True:
-            line = self.process.stdout.readline().decode('utf-8').strip()
-            if not line:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 break
-            if ':' in line:
-                key, value = line.split(':', 1)
-                headers[key.strip()] = value.strip()
+            msg = self._read_message(remaining)
+            if msg is None:
+                if self._stdout_eof:
+                    break
+                continue
+            self._dispatch(msg)
+
+    def wait_notification(
+        self,
+        method: str,
+        predicate: Callable[[Dict[str, Any]], bool],
+        timeout: float,
+    ) -> Optional[Dict[str, Any]]:
+        """Wait for a new `method` notification (one arriving after this call) matching `predicate`.
+
+        Returns None if the server closes stdout or `timeout` seconds pass first.
+        """
+        seen = len(self.notifications.get(method, []))
+        deadline = time.monotonic() + timeout
+        while True:
+            received = self.notifications.get(method, [])
+            for msg in received[seen:]:
+                if predicate(msg):
+                    return msg
+            seen = len(received)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            msg = self._read_message(remaining)
+            if msg is None:
+                if self._stdout_eof:
+                    return None
+                continue
+            self._dispatch(msg)
+
+    def poll(self, timeout: float):
+        """Wait up to `timeout` for any server output and consume what arrived."""
+        self._wait_readable(timeout)
+        while True:
+            msg = self._take_message()
+            if msg is None:
+                break
+            self._dispatch(msg)
 
-        content_length = int(headers.get('Content-Length', 0))
-        if content_length > 0:
-            response_bytes = self.process.stdout.read(content_length)
-            return json.loads(response_bytes.decode('utf-8'))
+    def _record_notification(self, msg: Dict[str, Any]):
+        self.notifications.setdefault(msg["method"], []).append(msg)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("  [notification: %s]", msg["method"])
 
-        return None
+    def _read_message(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Read a single JSON-RPC message from stdout, draining stderr while waiting.
+
+        Returns None when stdout closes or `timeout` seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            msg = self._take_message()
+            if msg is not None:
+                return msg
+            if self._stdout_eof:
+                return None
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            self._wait_readable(remaining)
+
+    def _take_message(self) -> Optional[Dict]:
+        """Pop one complete message off the receive buffer, if there is one."""
+        buf = self._rx_buf
+        while True:
+            idx = buf.find(b"\r\n\r\n")
+            if idx < 0:
+                return None
+
+            # Search the header block in place rather than splitting it into
+            # per-line objects; int() tolerates the surrounding whitespace.
+            content_length = 0
+            pos = buf.find(b"Content-Length:", 0, idx)
+            if pos >= 0:
+                eol = buf.find(b"\r\n", pos, idx)
+                content_length = int(buf[pos + 15:eol if eol >= 0 else idx])
+
+            end = idx + 4 + content_length
+            if len(buf) < end:
+                return None
+
+            body = buf[idx + 4:end]
+            del buf[:end]
+            if content_length > 0:
+                return json.loads(body)
+
+    def _wait_readable(self, timeout: Optional[float]):
+        """Block until stdout or stderr has data, then buffer whatever is ready.
+
+        Watching both pipes keeps stderr drained while we wait on a response,
+        so the server never stalls writing logs.
+        """
+        if not self.sel.get_map():
+            return
+        for key, _ in self.sel.select(timeout):
+            if key.data == "stderr":
+                self._drain_stderr()
+            else:
+                self._feed_stdout_buffer()
+
+    def _feed_stdout_buffer(self):
+        fd = self.process.stdout.fileno()
+        try:
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    self._stdout_eof = True
+                    self.sel.unregister(self.process.stdout)
+                    break
+                self._rx_buf += chunk
+        except BlockingIOError:
+            pass
 
     def send_notification(self, method: str, params: Dict[str, Any]):
         notification = {
@@ -91,68 +288,128 @@ class LSPClient:
             "params": params
         }
 
-        message = json.dumps(notification)
-        content_length = len(message.encode('utf-8'))
-        header = f"Content-Length: {content_length}\r\n\r\n"
-
-        full_message = header + message
-        print(f"→ Sending notification {method}")
+        log.debug("→ notification %s", method)
+        self._write_message(notification)
 
-        self.process.stdin.write(full_message.encode('utf-8'))
-        self.process.stdin.flush()
+    def _write_message(self, message: Dict[str, Any]):
+        """Frame and write a JSON-RPC message, encoding the payload once."""
+        if orjson is not None:
+            payload = orjson.dumps(message)
+        else:
+            payload = self._ENCODE(message).encode("utf-8")
+        header = b"Content-Length: %d\r\n\r\n" % len(payload)
+        fd = self.process.stdin.fileno()
+        if not hasattr(os, "writev"):
+            os.write(fd, header)
+            os.write(fd, payload)
+            return
+        chunks = [memoryview(header), memoryview(payload)]
+        while chunks:
+            written = os.writev(fd, chunks)
+            # writev may return early on a full pipe; resume where it stopped.
+            while chunks and written >= len(chunks[0]):
+                written -= len(chunks[0])
+                chunks.pop(0)
+            if chunks:
+                chunks[0] = chunks[0][written:]
 
     def read_stderr(self) -> List[str]:
-        """Read all available stderr output (non-blocking)."""
-        lines = []
-        while True:
-            ready, _, _ = select.select([self.process.stderr], [], [], 0)
-            if ready:
-                line = self.process.stderr.readline()
-                if line:
-                    lines.append(line.decode('utf-8').rstrip())
-                else:
+        """Return complete stderr lines received so far (non-blocking)."""
+        self._drain_stderr()
+        lines, _, tail = self._stderr_buf.rpartition(b"\n")
+        self._stderr_buf = bytearray(tail)
+        return [line.decode('utf-8', 'replace').rstrip() for line in lines.split(b"\n") if line]
+
+    def _drain_stderr(self):
+        fd = self.process.stderr.fileno()
+        try:
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    if not self._stderr_eof:
+                        self._stderr_eof = True
+                        self.sel.unregister(self.process.stderr)
                     break
-            else:
-                break
-        return lines
+                self._stderr_buf += chunk
+        except BlockingIOError:
+            pass
 
     def close(self):
+        self.sel.close()
         if self.process:
             self.process.terminate()
             self.process.wait()
 
-def print_stderr(client: LSPClient, label: str = ""):
-    """Print recent stderr output from the server."""
+def _scan_sources(root: str, entries: List[Tuple[str, int, int]]):
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                _scan_sources(entry.path, entries)
+            else:
+                st = entry.stat()
+                entries.append((entry.path, st.st_mtime_ns, st.st_size))
+
+def server_fingerprint() -> Tuple[str, int]:
+    """Hash (path, mtime, size) of the server sources and manifests.
+
+    Returns the hex digest and the newest source mtime in nanoseconds.
+    """
+    entries: List[Tuple[str, int, int]] = []
+    _scan_sources(str(SERVER_DIR / "src"), entries)
+    for manifest in (SERVER_DIR / "Cargo.toml", SERVER_DIR / "Cargo.lock"):
+        if manifest.exists():
+            st = manifest.stat()
+            entries.append((str(manifest), st.st_mtime_ns, st.st_size))
+    entries.sort()
+
+    digest = hashlib.blake2b(digest_size=16)
+    for path, mtime_ns, size in entries:
+        digest.update(f"{path}\0{mtime_ns}\0{size}\n".encode("utf-8"))
+    return digest.hexdigest(), max((mtime_ns for _, mtime_ns, _ in entries), default=0)
+
+def server_is_up_to_date(fingerprint: str, newest_mtime_ns: int) -> bool:
+    """True if the last successful build saw these sources and the binary is newer."""
+    try:
+        stamp = BUILD_STAMP.read_text().strip()
+        binary_mtime_ns = SERVER_BIN.stat().st_mtime_ns
+    except OSError:
+        return False
+    return stamp == fingerprint and binary_mtime_ns >= newest_mtime_ns
+
+@functools.lru_cache(maxsize=256)
+def _read_fixture(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", "strict")
+
+def read_fixture(path: Path) -> str:
+    """Return a fixture's text, re-reading it only if it changed on disk."""
+    st = path.stat()
+    return _read_fixture(str(path), st.st_mtime_ns, st.st_size)
+
+def print_stderr(client: LSPClient, label: str = "") -> List[str]:
+    """Print recent stderr output from the server and return the lines read."""
     lines = client.read_stderr()
     if lines:
         if label:
             print(f"\n  [{label} - stderr]:")
         for line in lines[-20:]:
             print(f"    {line}")
+    return lines
 
 def main():
     print("=== Kotlin Analyzer LSP Manual Test ===")
     print(f"Project root: {PROJECT_ROOT}")
     print(f"Fixture dir: {FIXTURE_DIR}\n")
 
-    # Use the fixture directory as project root
-    fixture_root = os.path.join(PROJECT_ROOT, "tests", "fixtures", "kotlin")
-
     # Read the test file
-    test_file = os.path.join(fixture_root, "correct", "ClassHierarchy.kt")
-    with open(test_file) as f:
-        test_code = f.read()
+    test_code = read_fixture(TEST_FILE)
 
-    test_uri = f"file://{test_file}"
-    root_uri = f"file://{fixture_root}"
-
-    print(f"Test file: {test_file}")
-    print(f"Test URI: {test_uri}")
-    print(f"Root URI: {root_uri}\n")
+    print(f"Test file: {TEST_FILE}")
+    print(f"Test URI: {TEST_URI}")
+    print(f"Root URI: {ROOT_URI}\n")
 
     # Start the server
-    server_path = os.path.join(PROJECT_ROOT, "server", "target", "debug", "kotlin-analyzer")
-    client = LSPClient(server_path)
+    client = LSPClient(SERVER_BIN)
 
     results = {}
 
@@ -163,7 +420,7 @@ def main():
         print("=" * 60)
         init_response = client.send_request("initialize", {
             "processId": os.getpid(),
-            "rootUri": root_uri,
+            "rootUri": ROOT_URI,
             "capabilities": {
                 "textDocument": {
                     "hover": {"dynamicRegistration": False},
@@ -192,10 +449,22 @@ def main():
 
         # Wait for sidecar to start (it runs in background)
         print("  Waiting for sidecar to start...")
-        for i in range(20):
-            time.sleep(1)
-            print_stderr(client, f"sidecar startup {i+1}s")
-            # Check if the sidecar has started by looking for "Ready" in stderr
+        start = time.monotonic()
+        deadline = start + SIDECAR_STARTUP_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"  ⚠️ Sidecar not ready after {SIDECAR_STARTUP_TIMEOUT}s, continuing anyway")
+                break
+            client.poll(min(remaining, 1.0))
+            elapsed = time.monotonic() - start
+            lines = print_stderr(client, f"sidecar startup {elapsed:.1f}s")
+            if any(READY_RE.search(line) for line in lines):
+                print(f"  Sidecar ready after {elapsed:.1f}s")
+                break
+            if client.process.poll() is not None:
+                print("  ❌ Server exited during sidecar startup")
+                break
 
         # 3. Open document
         print("\n" + "=" * 60)
@@ -203,25 +472,49 @@ def main():
         print("=" * 60)
         client.send_notification("textDocument/didOpen", {
             "textDocument": {
-                "uri": test_uri,
+                "uri": TEST_URI,
                 "languageId": "kotlin",
                 "version": 1,
                 "text": test_code
             }
         })
 
-        # Wait for analysis
-        time.sleep(3)
+        # Wait for the first analysis pass to publish diagnostics
+        if client.wait_notification(
+            "textDocument/publishDiagnostics",
+            lambda m: m["params"]["uri"] == TEST_URI,
+            timeout=DIAGNOSTICS_TIMEOUT,
+        ) is None:
+            print(f"  ⚠️ No diagnostics published within {DIAGNOSTICS_TIMEOUT}s")
         print_stderr(client, "after didOpen")
 
-        # 4. Hover over "Circle" class name (line 23, col 6)
+        # 4-6. Hover, completion and definition are pipelined: all three
+        # requests go out back-to-back and responses are collected by id.
         print("\n" + "=" * 60)
-        print("4. HOVER over 'Circle' class (line 23, col 6)")
+        print("4-6. SENDING hover, completion and definition")
         print("=" * 60)
-        hover_response = client.send_request("textDocument/hover", {
-            "textDocument": {"uri": test_uri},
+        hover_id = client.send_request_async("textDocument/hover", {
+            "textDocument": {"uri": TEST_URI},
             "position": {"line": 22, "character": 6}  # 0-indexed: line 23
         })
+        completion_id = client.send_request_async("textDocument/completion", {
+            "textDocument": {"uri": TEST_URI},
+            "position": {"line": 54, "character": 23}  # After "shape."
+        })
+        # class Circle(val radius: Double) : Shape("Circle"), Resizable {
+        #                                    ^36
+        definition_id = client.send_request_async("textDocument/definition", {
+            "textDocument": {"uri": TEST_URI},
+            "position": {"line": 22, "character": 36}  # "Shape" reference
+        })
+        responses = client.wait_for({hover_id, completion_id, definition_id})
+        print_stderr(client, "after requests")
+
+        # 4. Hover over "Circle" class name (line 23, col 6)
+        print("\n" + "=" * 60)
+        print("4. HOVER over 'Circle' class (line 23, col 6)")
+        print("=" * 60)
+        hover_response = responses.get(hover_id, {})
 
         if "result" in hover_response and hover_response["result"]:
             result = hover_response["result"]
@@ -241,16 +534,11 @@ def main():
             print(f"  Full response: {json.dumps(hover_response, indent=4)}")
             results["hover"] = "FAIL"
 
-        print_stderr(client, "after hover")
-
         # 5. Completion after "shape." (line 55)
         print("\n" + "=" * 60)
         print("5. COMPLETION after 'shape.' (line 55, col 23)")
         print("=" * 60)
-        completion_response = client.send_request("textDocument/completion", {
-            "textDocument": {"uri": test_uri},
-            "position": {"line": 54, "character": 23}  # After "shape."
-        })
+        completion_response = responses.get(completion_id, {})
 
         if "result" in completion_response:
             result = completion_response["result"]
@@ -275,19 +563,11 @@ def main():
             print(f"  ❌ COMPLETION failed")
             results["completion"] = "FAIL"
 
-        print_stderr(client, "after completion")
-
         # 6. Go to definition of "Shape" reference (line 23, col 36 - extends Shape)
         print("\n" + "=" * 60)
         print("6. GO TO DEFINITION of 'Shape' (line 23, col 36)")
         print("=" * 60)
-
-        # class Circle(val radius: Double) : Shape("Circle"), Resizable {
-        #                                    ^36
-        definition_response = client.send_request("textDocument/definition", {
-            "textDocument": {"uri": test_uri},
-            "position": {"line": 22, "character": 36}  # "Shape" reference
-        })
+        definition_response = responses.get(definition_id, {})
 
         if "result" in definition_response and definition_response["result"]:
             result = definition_response["result"]
@@ -303,47 +583,55 @@ def main():
             print(f"  ❌ DEFINITION returned null/empty")
             results["definition"] = "FAIL"
 
-        print_stderr(client, "after definition")
-
         # 7. Diagnostics test - open a file with errors
         print("\n" + "=" * 60)
         print("7. DIAGNOSTICS test - open TypeMismatch.kt")
         print("=" * 60)
 
-        error_file = os.path.join(fixture_root, "errors", "TypeMismatch.kt")
-        with open(error_file) as f:
-            error_code = f.read()
+        error_code = read_fixture(ERROR_FILE)
 
-        error_uri = f"file://{error_file}"
         client.send_notification("textDocument/didOpen", {
             "textDocument": {
-                "uri": error_uri,
+                "uri": ERROR_URI,
                 "languageId": "kotlin",
                 "version": 1,
                 "text": error_code
             }
         })
 
-        # Wait for diagnostics
-        time.sleep(5)
+        # Wait for diagnostics; the server may publish an empty list before
+        # analysis finishes, so hold out for a non-empty one.
+        published = client.wait_notification(
+            "textDocument/publishDiagnostics",
+            lambda m: m["params"]["uri"] == ERROR_URI and m["params"]["diagnostics"],
+            timeout=DIAGNOSTICS_TIMEOUT,
+        )
         print_stderr(client, "after error file open")
 
-        # The diagnostics come as notifications - we'll check stderr for them
-        results["diagnostics"] = "CHECK_STDERR"
+        if published:
+            diagnostics = published["params"]["diagnostics"]
+            print(f"  ✅ DIAGNOSTICS WORK! Found {len(diagnostics)} diagnostic(s)")
+            for diagnostic in diagnostics[:5]:
+                print(f"    - {diagnostic.get('message', '?')}")
+            results["diagnostics"] = "PASS"
+        else:
+            print(f"  ❌ No diagnostics published within {DIAGNOSTICS_TIMEOUT}s")
+            results["diagnostics"] = "FAIL"
 
         # Print summary
         print("\n" + "=" * 60)
         print("SUMMARY")
         print("=" * 60)
-        for feature, status in results.items():
-            icon = "✅" if status == "PASS" else "❌" if status == "FAIL" else "⚠️"
-            print(f"  {icon} {feature}: {status}")
+        summary = "\n".join(
+            f"  {ICON(status, '⚠️')} {feature}: {status}" for feature, status in results.items()
+        )
+        sys.stdout.write(summary + "\n")
 
         # Final stderr dump
         print("\n" + "=" * 60)
         print("FINAL STDERR (last 30 lines)")
         print("=" * 60)
-        time.sleep(1)
+        client.pump(1)
         lines = client.read_stderr()
         for line in lines[-30:]:
             print(f"  {line}")
@@ -355,17 +643,24 @@ def main():
     print("Test complete!")
 
 if __name__ == "__main__":
-    # First build the server
-    print("Building kotlin-analyzer...")
-    result = subprocess.run(
-        ["cargo", "build"],
-        cwd=os.path.join(PROJECT_ROOT, "server"),
-        capture_output=True
-    )
-    if result.returncode != 0:
-        print("Failed to build kotlin-analyzer")
-        print(result.stderr.decode('utf-8'))
-        sys.exit(1)
-    print("Build successful.\n")
+    logging.basicConfig(level=os.environ.get("LSPTEST_LOG", "INFO").upper(), format="%(message)s")
+
+    # First build the server, unless nothing changed since the last build
+    fingerprint, newest_mtime_ns = server_fingerprint()
+    if server_is_up_to_date(fingerprint, newest_mtime_ns):
+        print("kotlin-analyzer is up to date, skipping cargo build.\n")
+    else:
+        # Flush first: cargo inherits our stdout/stderr and streams its
+        # progress and errors straight to the terminal.
+        print("Building kotlin-analyzer...", flush=True)
+        result = subprocess.run(
+            ["cargo", "build", "--message-format=short"],
+            cwd=SERVER_DIR
+        )
+        if result.returncode != 0:
+            print("Failed to build kotlin-analyzer")
+            sys.exit(1)
+        BUILD_STAMP.write_text(fingerprint + "\n")
+        print("Build successful.\n")
 
     main()
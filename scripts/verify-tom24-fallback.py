@@ -48,9 +48,10 @@ class LspClient:
 
     def _send(self, payload: dict[str, Any]) -> None:
         body = json.dumps(payload).encode("utf-8")
-        header = f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+        header = b"Content-Length: %d\r\n\r\n" % len(body)
         assert self.proc.stdin is not None
-        self.proc.stdin.write(header + body)
+        self.proc.stdin.write(header)
+        self.proc.stdin.write(body)
         self.proc.stdin.flush()
 
     def notify(self, method: str, params: dict[str, Any]) -> None: